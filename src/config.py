@@ -2,6 +2,7 @@
 Configuration management for AIBerry API
 Uses pydantic-settings for environment-based configuration
 """
+from functools import lru_cache
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional
 
@@ -37,6 +38,7 @@ class Settings(BaseSettings):
     redis_password: Optional[str] = None
     redis_db: int = 0
     redis_vector_index: str = "aiberry_vectors"
+    redis_max_connections: int = 50
 
     # Memory Configuration
     redis_memory_host: str = "redis-service.aiberry.svc.cluster.local"
@@ -50,26 +52,42 @@ class Settings(BaseSettings):
     embedding_service_url: str = "http://aiberry-embeddings.aiberry.svc.cluster.local:8001"
     embedding_model: str = "all-MiniLM-L6-v2"
     embedding_dimension: int = 384
+    embedding_dtype: str = "float32"  # float32 | float16 | int8 (changing requires re-creating the index)
+    embedding_cache_size: int = 4096  # in-process entries
+    embedding_cache_ttl: int = 604800  # Redis entries, 7 days
 
     # Vector Search
+    vector_hnsw_m: int = 16
+    vector_hnsw_ef_construction: int = 200
+    vector_hnsw_ef_runtime: int = 64  # higher = better recall, slower queries
     similarity_threshold: float = 0.7
     max_search_results: int = 10
+    search_cache_size: int = 1024
+    search_cache_ttl: int = 60  # seconds
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = 0.97  # min cosine similarity to reuse cached results
+    semantic_cache_ttl: int = 300  # seconds
 
     # LLM Configuration
     llm_temperature: float = 0.7
     llm_max_tokens: int = 2048
     llm_timeout: int = 60
+    llm_max_context_tokens: int = 4096  # budget for document context in the prompt
 
     # Guardrails
     guardrails_enabled: bool = True
     guardrails_config_path: str = "./config/guardrails"
     max_input_length: int = 2000
     max_output_length: int = 4000
+    guardrails_llm_min_length: int = 200  # shorter texts are checked by regex only
+    guardrails_cache_size: int = 10000
+    guardrails_cache_ttl: int = 3600  # 1 hour
 
     # Document Processing
     max_file_size_mb: int = 10
-    chunk_size: int = 1000
-    chunk_overlap: int = 200
+    chunk_size: int = 256  # tokens, sized to the embedding model's input window
+    chunk_overlap: int = 32  # tokens
+    chunk_encoding: str = "cl100k_base"  # tiktoken encoding used for chunking
 
     # Security
     allowed_origins: list[str] = ["http://fend.aisolution.com"]
@@ -95,3 +113,9 @@ class Settings(BaseSettings):
         if self.redis_password:
             return f"redis://:{self.redis_password}@{self.redis_memory_host}:{self.redis_memory_port}/{self.redis_memory_db}"
         return f"redis://{self.redis_memory_host}:{self.redis_memory_port}/{self.redis_memory_db}"
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Get cached application settings (parsed once per process)"""
+    return Settings()
@@ -3,23 +3,25 @@ AIBerry API Server
 Enterprise-grade FastAPI application with LangChain, Redis, and Guardrails
 """
 import os
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from typing import List, Optional
 
 from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from pydantic import BaseModel, Field
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
 from fastapi.responses import Response
 
-from .config import Settings
+from .config import get_settings
 from .services.llm_service import LLMService
 from .services.vector_service import VectorService
 from .services.memory_service import MemoryService
 from .services.guardrails_service import GuardrailsService
 from .services.document_service import DocumentService
+from .services.redis_pool import get_memory_redis_pool, get_vector_redis_pool
 
 # Configure logging
 logging.basicConfig(
@@ -34,28 +36,47 @@ REQUEST_DURATION = Histogram('aiberry_api_request_duration_seconds', 'Request du
 QUERY_COUNT = Counter('aiberry_queries_total', 'Total queries processed', ['type'])
 DOCUMENT_COUNT = Counter('aiberry_documents_total', 'Total documents processed', ['operation'])
 
+# Pre-bound label children for the hot paths
+REQ_HEALTH_OK = REQUEST_COUNT.labels(method='GET', endpoint='/health', status='200')
+REQ_QUERY_OK = REQUEST_COUNT.labels(method='POST', endpoint='/api/v1/query', status='200')
+REQ_QUERY_ERR = REQUEST_COUNT.labels(method='POST', endpoint='/api/v1/query', status='500')
+REQ_UPLOAD_OK = REQUEST_COUNT.labels(method='POST', endpoint='/api/v1/documents/upload', status='200')
+REQ_UPLOAD_ERR = REQUEST_COUNT.labels(method='POST', endpoint='/api/v1/documents/upload', status='500')
+QUERY_USER = QUERY_COUNT.labels(type='user_query')
+DOCUMENT_UPLOAD = DOCUMENT_COUNT.labels(operation='upload')
+
 # Global services
 services = {}
 
+# Strong references to fire-and-forget tasks so they aren't garbage collected
+background_tasks = set()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     logger.info("Starting AIBerry API Server...")
 
     # Initialize settings
-    settings = Settings()
+    settings = get_settings()
+
+    # Shared Redis connection pools (one per database)
+    vector_pool = get_vector_redis_pool(settings)
+    memory_pool = get_memory_redis_pool(settings)
 
     # Initialize services
     try:
         services['llm'] = LLMService(settings)
-        services['vector'] = VectorService(settings)
-        services['memory'] = MemoryService(settings)
+        services['vector'] = VectorService(settings, pool=vector_pool)
+        services['memory'] = MemoryService(settings, pool=memory_pool)
         services['guardrails'] = GuardrailsService(settings)
         services['document'] = DocumentService(settings, services['vector'])
 
-        await services['vector'].initialize()
-        await services['memory'].initialize()
-        await services['guardrails'].initialize()
+        # Independent connections, so initialize concurrently
+        await asyncio.gather(
+            services['vector'].initialize(),
+            services['memory'].initialize(),
+            services['guardrails'].initialize()
+        )
 
         logger.info("All services initialized successfully")
     except Exception as e:
@@ -66,8 +87,17 @@ async def lifespan(app: FastAPI):
 
     # Cleanup
     logger.info("Shutting down AIBerry API Server...")
-    await services['vector'].close()
-    await services['memory'].close()
+
+    # Let pending memory writes finish before their clients and pools close
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await asyncio.gather(
+        services['vector'].close(),
+        services['memory'].close()
+    )
+    await asyncio.gather(
+        vector_pool.disconnect(),
+        memory_pool.disconnect()
+    )
 
 # Create FastAPI application
 app = FastAPI(
@@ -75,6 +105,7 @@ app = FastAPI(
     description="Enterprise AI Agent API with LangChain, Redis Vector DB, and Guardrails",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/api/docs",
     redoc_url="/api/redoc",
     openapi_url="/api/openapi.json"
@@ -156,7 +187,7 @@ async def health_check(
     memory_service: MemoryService = Depends(get_memory_service)
 ):
     """Health check endpoint"""
-    REQUEST_COUNT.labels(method='GET', endpoint='/health', status='200').inc()
+    REQ_HEALTH_OK.inc()
 
     services_status = {
         "redis_vector": await vector_service.health_check(),
@@ -188,11 +219,24 @@ async def query(
     Applies guardrails, retrieves context from vector DB, and manages conversation memory
     """
     try:
-        REQUEST_COUNT.labels(method='POST', endpoint='/api/v1/query', status='200').inc()
-        QUERY_COUNT.labels(type='user_query').inc()
+        REQ_QUERY_OK.inc()
+        QUERY_USER.inc()
+
+        # Guardrails, memory and context lookups are independent, so run them
+        # concurrently; the task group cancels the lookups if anything fails
+        async with asyncio.TaskGroup() as lookups:
+            history_task = lookups.create_task(memory_service.get_short_term_memory(request.session_id))
+            context_task = None
+            if request.use_context:
+                context_task = lookups.create_task(vector_service.similarity_search(request.query, k=5))
+
+            # Apply input guardrails
+            guardrails_result = await guardrails_service.validate_input(request.query)
+            if not guardrails_result['passed']:
+                history_task.cancel()
+                if context_task:
+                    context_task.cancel()
 
-        # Apply input guardrails
-        guardrails_result = await guardrails_service.validate_input(request.query)
         if not guardrails_result['passed']:
             return QueryResponse(
                 response=guardrails_result['message'],
@@ -200,13 +244,9 @@ async def query(
                 guardrails_passed=False
             )
 
-        # Retrieve conversation memory
-        conversation_history = await memory_service.get_short_term_memory(request.session_id)
-
-        # Retrieve relevant context from vector DB
-        context_docs = []
-        if request.use_context:
-            context_docs = await vector_service.similarity_search(request.query, k=5)
+        # Retrieve conversation memory and relevant context from vector DB
+        conversation_history = history_task.result()
+        context_docs = context_task.result() if context_task else []
 
         # Generate response using LLM
         response_data = await llm_service.generate_response(
@@ -221,12 +261,14 @@ async def query(
         if not output_guardrails['passed']:
             response_data['response'] = output_guardrails['message']
 
-        # Store in memory
-        await memory_service.add_to_short_term_memory(
+        # Store in memory in the background so the response isn't blocked on the write
+        memory_task = asyncio.create_task(memory_service.add_to_short_term_memory(
             session_id=request.session_id,
             user_message=request.query,
             ai_message=response_data['response']
-        )
+        ))
+        background_tasks.add(memory_task)
+        memory_task.add_done_callback(background_tasks.discard)
 
         return QueryResponse(
             response=response_data['response'],
@@ -237,8 +279,10 @@ async def query(
         )
 
     except Exception as e:
+        if isinstance(e, ExceptionGroup):
+            e = e.exceptions[0]  # first failure from the concurrent lookups
         logger.error(f"Error processing query: {e}")
-        REQUEST_COUNT.labels(method='POST', endpoint='/api/v1/query', status='500').inc()
+        REQ_QUERY_ERR.inc()
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
 @app.post("/api/v1/documents/upload", response_model=DocumentUploadResponse)
@@ -251,8 +295,8 @@ async def upload_document(
     Supports PDF, DOCX, TXT formats
     """
     try:
-        REQUEST_COUNT.labels(method='POST', endpoint='/api/v1/documents/upload', status='200').inc()
-        DOCUMENT_COUNT.labels(operation='upload').inc()
+        REQ_UPLOAD_OK.inc()
+        DOCUMENT_UPLOAD.inc()
 
         # Validate file type
         allowed_extensions = ['.pdf', '.docx', '.txt']
@@ -263,13 +307,11 @@ async def upload_document(
                 detail=f"File type not supported. Allowed: {', '.join(allowed_extensions)}"
             )
 
-        # Read file content
-        content = await file.read()
-
-        # Process document
+        # Process document straight from the upload's spooled temp file
+        # (kept in memory up to 1MB, on disk beyond) instead of reading it into bytes
         result = await document_service.process_document(
             filename=file.filename,
-            content=content,
+            content=file.file,
             file_type=file_extension
         )
 
@@ -279,7 +321,7 @@ async def upload_document(
         raise
     except Exception as e:
         logger.error(f"Error uploading document: {e}")
-        REQUEST_COUNT.labels(method='POST', endpoint='/api/v1/documents/upload', status='500').inc()
+        REQ_UPLOAD_ERR.inc()
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
 @app.get("/api/v1/documents", response_model=List[dict])
@@ -301,8 +343,10 @@ async def get_memory(
 ):
     """Retrieve conversation memory for a session"""
     try:
-        short_term = await memory_service.get_short_term_memory(session_id)
-        long_term = await memory_service.get_long_term_memory(session_id)
+        short_term, long_term = await asyncio.gather(
+            memory_service.get_short_term_memory(session_id),
+            memory_service.get_long_term_memory(session_id)
+        )
 
         return MemoryResponse(
             session_id=session_id,
@@ -328,10 +372,13 @@ async def clear_memory(
 
 if __name__ == "__main__":
     import uvicorn
+    settings = get_settings()
     uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
+        "src.main:app",
+        host=settings.api_host,
+        port=settings.api_port,
+        workers=settings.api_workers,
+        loop="uvloop",
+        http="httptools",
+        log_level=settings.log_level.lower()
     )
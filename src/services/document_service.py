@@ -2,21 +2,38 @@
 Document Processing Service
 Handles document upload, parsing, chunking, and storage
 """
+import asyncio
+import ctypes
+import io
 import logging
-import uuid
-from typing import List, Dict, Any
-from io import BytesIO
+import mmap
+import os
+import threading
+import zipfile
+from typing import List, Dict, Any, BinaryIO, Callable, Optional
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import blake3
+import tiktoken
 from langchain.schema import Document
-import PyPDF2
-from docx import Document as DocxDocument
+import pypdfium2 as pdfium
+from lxml import etree
 
 from ..config import Settings
 from .vector_service import VectorService
 
 logger = logging.getLogger(__name__)
 
+# WordprocessingML namespace used in DOCX document.xml
+DOCX_NAMESPACES = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
+
+# PDFium is not thread-safe, even across separate documents; every call into
+# it from extraction worker threads must hold this lock
+PDFIUM_LOCK = threading.Lock()
+
+# Uploads are spooled in memory up to 1 MiB (Starlette's UploadFile default),
+# so only larger content is guaranteed to already be on disk
+MAPPED_CONTENT_MIN_BYTES = 1024 * 1024
+
 
 class DocumentService:
     """Service for document processing and management"""
@@ -25,18 +42,15 @@ class DocumentService:
         self.settings = settings
         self.vector_service = vector_service
 
-        # Text splitter for chunking
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings.chunk_size,
-            chunk_overlap=settings.chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
+        # Token-aligned chunking (tiktoken encodes natively, so no Python-level splitting)
+        if settings.chunk_overlap >= settings.chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.encoding = tiktoken.get_encoding(settings.chunk_encoding)
 
     async def process_document(
         self,
         filename: str,
-        content: bytes,
+        content: BinaryIO,
         file_type: str
     ) -> Dict[str, Any]:
         """
@@ -44,37 +58,33 @@ class DocumentService:
 
         Args:
             filename: Original filename
-            content: File content as bytes
+            content: Seekable binary file object with the file content
             file_type: File extension (.pdf, .docx, .txt)
 
         Returns:
             Dict with processing results
         """
         try:
-            # Validate file size
-            file_size_mb = len(content) / (1024 * 1024)
+            # Validate file size without reading the content
+            content.seek(0, os.SEEK_END)
+            file_size_mb = content.tell() / (1024 * 1024)
+            content.seek(0)
             if file_size_mb > self.settings.max_file_size_mb:
                 raise ValueError(f"File size exceeds maximum of {self.settings.max_file_size_mb}MB")
 
-            # Extract text based on file type
-            if file_type == '.pdf':
-                text = await self._extract_pdf_text(content)
-            elif file_type == '.docx':
-                text = await self._extract_docx_text(content)
-            elif file_type == '.txt':
-                text = content.decode('utf-8')
-            else:
-                raise ValueError(f"Unsupported file type: {file_type}")
-
-            # Validate extracted text
-            if not text.strip():
-                raise ValueError("No text could be extracted from the document")
-
-            # Create document ID
-            document_id = str(uuid.uuid4())
+            # Content-addressed document ID, so re-uploads of the same file are skipped
+            document_id = await asyncio.to_thread(self._hash_content, content)
+            if await self.vector_service.document_exists(document_id):
+                logger.info(f"Document {filename} already stored as {document_id}")
+                return {
+                    'document_id': document_id,
+                    'filename': filename,
+                    'chunks_created': 0,
+                    'status': 'exists'
+                }
 
-            # Split into chunks
-            chunks = self.text_splitter.split_text(text)
+            # Extract text and split into chunks off the event loop
+            chunks = await asyncio.to_thread(self._extract_and_split, content, file_type)
 
             # Create Document objects
             documents = [
@@ -110,29 +120,120 @@ class DocumentService:
             logger.error(f"Error processing document: {e}")
             raise
 
-    async def _extract_pdf_text(self, content: bytes) -> str:
-        """Extract text from PDF"""
-        try:
-            pdf_file = BytesIO(content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
+    @staticmethod
+    def _hash_content(content: BinaryIO) -> str:
+        """Compute the BLAKE3 content hash used as document ID"""
+        hasher = blake3.blake3()
+        for block in iter(lambda: content.read(1024 * 1024), b''):
+            hasher.update(block)
+        content.seek(0)
+        return hasher.hexdigest(16)
 
-            text_parts = []
-            for page in pdf_reader.pages:
-                text_parts.append(page.extract_text())
+    def _extract_and_split(self, content: BinaryIO, file_type: str) -> List[str]:
+        """Extract text and split it into chunks (blocking, run off the event loop)"""
+        # Extract text based on file type
+        if file_type == '.pdf':
+            text = self._extract_pdf_text(content)
+        elif file_type == '.docx':
+            text = self._extract_docx_text(content)
+        elif file_type == '.txt':
+            text = content.read().decode('utf-8-sig', errors='replace')
+        else:
+            raise ValueError(f"Unsupported file type: {file_type}")
 
-            return "\n\n".join(text_parts)
+        # Validate extracted text
+        if not text.strip():
+            raise ValueError("No text could be extracted from the document")
+
+        # Split into chunks
+        return self._split_text(text)
+
+    def _split_text(self, text: str) -> List[str]:
+        """Split text into overlapping windows of chunk_size tokens"""
+        tokens = self.encoding.encode_ordinary(text)
+        size = self.settings.chunk_size
+        overlap = self.settings.chunk_overlap
+
+        return [
+            self.encoding.decode(tokens[start:start + size])
+            for start in range(0, max(len(tokens) - overlap, 1), size - overlap)
+        ]
+
+    def _extract_pdf_text(self, content: BinaryIO) -> str:
+        """Extract text from PDF"""
+        try:
+            return self._with_mapped_content(content, self._read_pdf_text)
 
         except Exception as e:
             logger.error(f"Error extracting PDF text: {e}")
             raise ValueError(f"Failed to extract text from PDF: {str(e)}")
 
-    async def _extract_docx_text(self, content: bytes) -> str:
+    @staticmethod
+    def _read_pdf_text(source: Any) -> str:
+        """Read text from every page of a PDF source"""
+        with PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(source)
+            try:
+                text_parts = []
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    text_parts.append(textpage.get_text_bounded())
+                    textpage.close()
+                    page.close()
+
+                return "\n\n".join(text_parts)
+            finally:
+                pdf.close()
+
+    @staticmethod
+    def _with_mapped_content(content: BinaryIO, reader: Callable[[Any], str]) -> str:
+        """
+        Call reader with a zero-copy memory map of file-backed content
+
+        PDFium loads a ctypes buffer in place instead of pulling data through
+        Python read()/seek() callbacks. Content up to MAPPED_CONTENT_MIN_BYTES
+        is passed as bytes: it may be an upload still spooled in memory, and
+        asking a spool for its fileno() would force it to disk first. Other
+        content without a file descriptor is passed to reader unchanged.
+        """
+        if isinstance(content, io.BytesIO):
+            return reader(content.getvalue())
+
+        content.seek(0, os.SEEK_END)
+        size = content.tell()
+        content.seek(0)
+        if size <= MAPPED_CONTENT_MIN_BYTES:
+            data = content.read()
+            content.seek(0)
+            return reader(data)
+
+        try:
+            content.flush()
+            fileno = content.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return reader(content)
+
+        # ACCESS_COPY gives a writable (copy-on-write) view, which ctypes requires
+        mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_COPY)
+        try:
+            return reader((ctypes.c_char * len(mapped)).from_buffer(mapped))
+        finally:
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # Buffer still referenced; unmapped when garbage collected
+
+    def _extract_docx_text(self, content: BinaryIO) -> str:
         """Extract text from DOCX"""
         try:
-            docx_file = BytesIO(content)
-            doc = DocxDocument(docx_file)
+            # Read the document XML directly instead of building python-docx objects
+            with zipfile.ZipFile(content) as docx_zip:
+                root = etree.fromstring(docx_zip.read('word/document.xml'))
 
-            text_parts = [paragraph.text for paragraph in doc.paragraphs]
+            text_parts = [
+                "".join(paragraph.xpath('.//w:t/text()', namespaces=DOCX_NAMESPACES))
+                for paragraph in root.iterfind('.//w:p', namespaces=DOCX_NAMESPACES)
+            ]
             return "\n\n".join(text_parts)
 
         except Exception as e:
@@ -158,14 +259,16 @@ class DocumentService:
     async def search_documents(
         self,
         query: str,
-        k: int = 5
+        k: int = 5,
+        document_id: Optional[str] = None
     ) -> List[Dict[str, Any]]:
-        """Search documents by query"""
+        """Search documents by query, optionally within a single document"""
         try:
             results = await self.vector_service.similarity_search(
                 query=query,
                 k=k,
-                score_threshold=self.settings.similarity_threshold
+                score_threshold=self.settings.similarity_threshold,
+                filter_expr=self.vector_service.tag_filter("document_id", document_id) if document_id else None
             )
 
             return [
@@ -1,18 +1,108 @@
 """
 Guardrails Service for input/output validation and safety using NeMo Guardrails
 """
+import asyncio
+import hashlib
 import logging
 import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
+from cachetools import TTLCache
 from nemoguardrails import RailsConfig, LLMRails
 from nemoguardrails.rails.llm.config import Model
 
+try:
+    import hyperscan  # Optional: vectorized multi-pattern scanning
+except ImportError:
+    hyperscan = None
+
 from ..config import Settings
 
 logger = logging.getLogger(__name__)
 
 
+def luhn_valid(number: str) -> bool:
+    """Check a digit string against the Luhn checksum used by payment card numbers"""
+    total = 0
+    for position, char in enumerate(reversed(number)):
+        digit = ord(char) - 48
+        if position % 2:
+            digit = digit * 2 - 9 if digit > 4 else digit * 2
+        total += digit
+    return total % 10 == 0
+
+
+# Post-match validators for PII types whose pattern alone over-matches
+PII_VALIDATORS = {
+    'CC': luhn_valid,
+}
+
+# Fallback patterns for content filtering (used if NeMo fails)
+BLOCKED_PATTERNS = (
+    r'(hack|exploit|vulnerability|malware|phishing)',
+    r'(password|credential|api[_\s]?key|secret[_\s]?key)',
+    r'(inject|sql|xss|csrf)',
+    r'(bypass|circumvent|override)\s+(security|safety)',
+)
+
+# PII patterns
+PII_PATTERNS = (
+    (r'\b\d{3}-\d{2}-\d{4}\b', 'SSN'),  # SSN
+    (r'\b\d{13,19}\b', 'CC'),  # Credit card (candidates are Luhn-checked)
+    (r'\b[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}\b', 'EMAIL'),
+)
+
+# Compiled once at import and shared by every GuardrailsService instance.
+# All patterns are lowercase; validation scans lowercase the text once
+# instead of case-folding on every match attempt.
+
+# Blocked keywords get their own search so a PII match (e.g. an email
+# address) can never consume a keyword inside it
+BLOCKED_REGEX = re.compile("|".join(f"(?:{pattern})" for pattern in BLOCKED_PATTERNS))
+
+# PII patterns fused into one alternation of named groups (group = PII type)
+PII_SCAN_REGEX = re.compile(
+    "|".join(f"(?P<{pii_type}>{pattern})" for pattern, pii_type in PII_PATTERNS)
+)
+
+# PII-only alternation for sanitize_text, so blocked keywords can't hide PII.
+# Case-insensitive because it rewrites the original-case text.
+PII_REGEX = re.compile(
+    "|".join(f"(?P<{pii_type}>{pattern})" for pattern, pii_type in PII_PATTERNS),
+    re.IGNORECASE
+)
+
+
+def _compile_hyperscan():
+    """Compile blocked and PII patterns into a Hyperscan database"""
+    expressions = [
+        pattern.encode()
+        for pattern in BLOCKED_PATTERNS + tuple(p for p, _ in PII_PATTERNS)
+    ]
+    # Validated PII types need the match start offset to read the matched value
+    flags = [0] * len(BLOCKED_PATTERNS) + [
+        hyperscan.HS_FLAG_SOM_LEFTMOST if pii_type in PII_VALIDATORS else 0
+        for _, pii_type in PII_PATTERNS
+    ]
+    try:
+        database = hyperscan.Database()
+        database.compile(
+            expressions=expressions,
+            ids=list(range(len(expressions))),
+            elements=len(expressions),
+            flags=flags
+        )
+        logger.info("Guardrail patterns compiled with Hyperscan")
+        return database
+    except Exception as e:
+        logger.warning(f"Hyperscan compilation failed, using re: {e}")
+        return None
+
+
+# Hyperscan database over the same patterns, when the library is installed
+HS_DATABASE = _compile_hyperscan() if hyperscan else None
+
+
 class GuardrailsService:
     """Service for applying guardrails to inputs and outputs using NeMo Guardrails"""
 
@@ -20,21 +110,73 @@ class GuardrailsService:
         self.settings = settings
         self.enabled = settings.guardrails_enabled
         self.rails: Optional[LLMRails] = None
+        self._rails_config: Optional[RailsConfig] = None
+        self._rails_lock = asyncio.Lock()
+
+        # NeMo decisions keyed by (direction, text hash); each miss costs an LLM round-trip
+        self.decision_cache: TTLCache = TTLCache(
+            maxsize=settings.guardrails_cache_size,
+            ttl=settings.guardrails_cache_ttl
+        )
+
+        # Shared precompiled patterns
+        self.blocked_patterns = BLOCKED_PATTERNS
+        self.pii_patterns = PII_PATTERNS
+        self.blocked_regex = BLOCKED_REGEX
+        self.pii_scan_regex = PII_SCAN_REGEX
+        self.pii_regex = PII_REGEX
+        self.hs_database = HS_DATABASE
+
+    def _scan(self, text: str) -> Tuple[Optional[str], List[str]]:
+        """
+        Scan lowercased text once for blocked content and PII
+
+        Returns:
+            Tuple of (first blocked match or None, PII types found)
+        """
+        lowered = text.lower()
+        if self.hs_database is not None:
+            return self._scan_hyperscan(lowered)
+
+        blocked = self.blocked_regex.search(lowered)
+        if blocked:
+            return blocked.group(0), []
+
+        pii_found = []
+        for match in self.pii_scan_regex.finditer(lowered):
+            pii_type = match.lastgroup
+            if pii_type not in pii_found and self._is_pii(pii_type, match.group(0)):
+                pii_found.append(pii_type)
+        return None, pii_found
+
+    @staticmethod
+    def _is_pii(pii_type: str, value: str) -> bool:
+        """Confirm a PII pattern match with its validator, if the type has one"""
+        validator = PII_VALIDATORS.get(pii_type)
+        return validator is None or validator(value)
+
+    def _scan_hyperscan(self, text: str) -> Tuple[Optional[str], List[str]]:
+        """Hyperscan variant of _scan; reports the blocked pattern instead of the matched text"""
+        blocked_count = len(self.blocked_patterns)
+        blocked = []
+        pii_found = []
+
+        data = text.encode()
+
+        def on_match(pattern_id, start, end, flags, context):
+            if pattern_id < blocked_count:
+                blocked.append(self.blocked_patterns[pattern_id])
+            else:
+                pii_type = self.pii_patterns[pattern_id - blocked_count][1]
+                if pii_type not in pii_found and self._is_pii(pii_type, data[start:end].decode()):
+                    pii_found.append(pii_type)
+
+        # The database owns its scratch space, allocated once at compile time
+        self.hs_database.scan(data, match_event_handler=on_match)
 
-        # Fallback patterns for content filtering (used if NeMo fails)
-        self.blocked_patterns = [
-            r'(?i)(hack|exploit|vulnerability|malware|phishing)',
-            r'(?i)(password|credential|api[_\s]?key|secret[_\s]?key)',
-            r'(?i)(inject|sql|xss|csrf)',
-            r'(?i)(bypass|circumvent|override)\s+(security|safety)',
-        ]
-
-        # PII patterns
-        self.pii_patterns = [
-            (r'\b\d{3}-\d{2}-\d{4}\b', 'SSN'),  # SSN
-            (r'\b\d{16}\b', 'CC'),  # Credit card
-            (r'\b[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}\b', 'EMAIL', re.IGNORECASE),
-        ]
+        if blocked:
+            return blocked[0], []
+        return None, pii_found
 
     async def initialize(self):
         """Initialize NeMo Guardrails"""
@@ -95,13 +237,64 @@ class GuardrailsService:
                 """
             )
 
-            self.rails = LLMRails(config)
-            logger.info("NeMo Guardrails initialized successfully")
+            # LLMRails itself is built on first use (see _get_rails)
+            self._rails_config = config
+            logger.info("NeMo Guardrails configured successfully")
 
         except Exception as e:
             logger.error(f"Failed to initialize NeMo Guardrails: {e}")
             logger.warning("Falling back to regex-based guardrails")
-            self.rails = None
+            self._rails_config = None
+
+    async def _get_rails(self) -> Optional[LLMRails]:
+        """
+        Build LLMRails on first use, off the event loop
+
+        The constructor parses Colang, creates LLM clients and builds the
+        embedding index synchronously, so it runs in a worker thread.
+        """
+        if self.rails or not self._rails_config:
+            return self.rails
+
+        async with self._rails_lock:
+            if not self.rails and self._rails_config:
+                try:
+                    self.rails = await asyncio.to_thread(LLMRails, self._rails_config)
+                    logger.info("NeMo Guardrails initialized successfully")
+                except Exception as e:
+                    logger.error(f"Failed to initialize NeMo Guardrails: {e}")
+                    logger.warning("Falling back to regex-based guardrails")
+                    self._rails_config = None
+        return self.rails
+
+    async def _rails_decision(
+        self,
+        direction: str,
+        text: str,
+        messages: List[Dict[str, str]]
+    ) -> Dict[str, Any]:
+        """
+        Get the NeMo Guardrails decision for text, cached by content hash
+
+        Args:
+            direction: 'input' or 'output', kept apart since the rails prompts differ
+            text: Text being validated
+            messages: Messages sent to NeMo on a cache miss
+
+        Returns:
+            Dict with 'blocked' flag and NeMo's response 'message'
+        """
+        key = (direction, hashlib.blake2b(text.encode(), digest_size=16).digest())
+        decision = self.decision_cache.get(key)
+        if decision is None:
+            rails = await self._get_rails()
+            if rails is None:
+                return {'blocked': False, 'message': ''}
+            response = await rails.generate_async(messages=messages)
+            content = response.get("content", "") if response else ""
+            decision = {'blocked': "cannot" in content.lower(), 'message': content}
+            self.decision_cache[key] = decision
+        return decision
 
     async def validate_input(self, text: str) -> Dict[str, Any]:
         """
@@ -131,43 +324,38 @@ class GuardrailsService:
                     'message': "Input cannot be empty"
                 }
 
-            # Use NeMo Guardrails if available
-            if self.rails:
+            # Cheap deterministic check first: blocked content and PII with regex
+            blocked, pii_found = self._scan(text)
+            if blocked:
+                logger.warning(f"Input blocked by guardrail pattern match: {blocked!r}")
+                return {
+                    'passed': False,
+                    'message': "Input contains potentially unsafe content. Please rephrase your query."
+                }
+
+            # Escalate to NeMo Guardrails only for inputs long enough to need semantic review
+            if self._rails_config and len(text) > self.settings.guardrails_llm_min_length:
                 try:
-                    response = await self.rails.generate_async(
+                    decision = await self._rails_decision(
+                        'input',
+                        text,
                         messages=[{"role": "user", "content": text}]
                     )
 
                     # If NeMo blocked the input, it will return a refusal message
-                    if response and "cannot" in response.get("content", "").lower():
+                    if decision['blocked']:
                         logger.warning(f"Input blocked by NeMo Guardrails")
                         return {
                             'passed': False,
-                            'message': response.get("content", "Input contains potentially unsafe content.")
+                            'message': decision['message'] or "Input contains potentially unsafe content."
                         }
                 except Exception as nemo_error:
                     logger.error(f"NeMo Guardrails validation error: {nemo_error}")
-                    # Fall through to regex-based validation
-
-            # Fallback: Check for blocked content with regex
-            for pattern in self.blocked_patterns:
-                if re.search(pattern, text):
-                    logger.warning(f"Input blocked by guardrail pattern: {pattern}")
-                    return {
-                        'passed': False,
-                        'message': "Input contains potentially unsafe content. Please rephrase your query."
-                    }
-
-            # Check for PII (warning only, not blocking)
-            pii_found = []
-            for pattern_data in self.pii_patterns:
-                pattern = pattern_data[0]
-                pii_type = pattern_data[1]
-                flags = pattern_data[2] if len(pattern_data) > 2 else 0
-
-                if re.search(pattern, text, flags):
-                    pii_found.append(pii_type)
-                    logger.warning(f"PII detected in input: {pii_type}")
+                    # Regex checks above still apply
+
+            # PII is a warning only, not blocking
+            for pii_type in pii_found:
+                logger.warning(f"PII detected in input: {pii_type}")
 
             if pii_found:
                 return {
@@ -204,10 +392,30 @@ class GuardrailsService:
                     'message': "Response too long. Please try a more specific query."
                 }
 
-            # Use NeMo Guardrails if available for output validation
-            if self.rails:
+            # Cheap deterministic check first: blocked content and potential PII leakage
+            blocked, pii_found = self._scan(text)
+            if blocked:
+                logger.warning(f"Output blocked by guardrail pattern match: {blocked!r}")
+                return {
+                    'passed': False,
+                    'message': "I cannot provide that information. Please ask a different question."
+                }
+
+            for pii_type in pii_found:
+                logger.error(f"PII leaked in output: {pii_type}")
+
+            if pii_found:
+                return {
+                    'passed': False,
+                    'message': "I apologize, but I cannot provide that response for privacy reasons."
+                }
+
+            # Escalate to NeMo Guardrails only for outputs long enough to need semantic review
+            if self._rails_config and len(text) > self.settings.guardrails_llm_min_length:
                 try:
-                    response = await self.rails.generate_async(
+                    decision = await self._rails_decision(
+                        'output',
+                        text,
                         messages=[
                             {"role": "user", "content": "Check this response"},
                             {"role": "assistant", "content": text}
@@ -215,7 +423,7 @@ class GuardrailsService:
                     )
 
                     # If NeMo flags the output, block it
-                    if response and "cannot" in response.get("content", "").lower():
+                    if decision['blocked']:
                         logger.warning(f"Output blocked by NeMo Guardrails")
                         return {
                             'passed': False,
@@ -223,33 +431,7 @@ class GuardrailsService:
                         }
                 except Exception as nemo_error:
                     logger.error(f"NeMo Guardrails output validation error: {nemo_error}")
-                    # Fall through to regex-based validation
-
-            # Fallback: Check for blocked content in output
-            for pattern in self.blocked_patterns:
-                if re.search(pattern, text):
-                    logger.warning(f"Output blocked by guardrail pattern: {pattern}")
-                    return {
-                        'passed': False,
-                        'message': "I cannot provide that information. Please ask a different question."
-                    }
-
-            # Check for potential PII leakage
-            pii_found = []
-            for pattern_data in self.pii_patterns:
-                pattern = pattern_data[0]
-                pii_type = pattern_data[1]
-                flags = pattern_data[2] if len(pattern_data) > 2 else 0
-
-                if re.search(pattern, text, flags):
-                    pii_found.append(pii_type)
-                    logger.error(f"PII leaked in output: {pii_type}")
-
-            if pii_found:
-                return {
-                    'passed': False,
-                    'message': "I apologize, but I cannot provide that response for privacy reasons."
-                }
+                    # Regex checks above still apply
 
             return {'passed': True}
 
@@ -267,17 +449,15 @@ class GuardrailsService:
         Returns:
             Sanitized text
         """
-        sanitized = text
-
-        # Mask PII
-        for pattern_data in self.pii_patterns:
-            pattern = pattern_data[0]
-            pii_type = pattern_data[1]
-            flags = pattern_data[2] if len(pattern_data) > 2 else 0
-
-            sanitized = re.sub(pattern, f"[{pii_type}_REDACTED]", sanitized, flags=flags)
-
-        return sanitized
+        # Mask all PII in a single pass
+        return self.pii_regex.sub(self._mask_pii, text)
+
+    def _mask_pii(self, match: re.Match) -> str:
+        """Replacement callback for sanitize_text"""
+        pii_type = match.lastgroup
+        if not self._is_pii(pii_type, match.group(0)):
+            return match.group(0)
+        return f"[{pii_type}_REDACTED]"
 
     async def check_rate_limit(self, user_id: str) -> bool:
         """
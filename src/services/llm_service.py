@@ -2,8 +2,10 @@
 LLM Service using Google Gemini via LangChain
 """
 import logging
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 
+import tiktoken
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.chains import ConversationalRetrievalChain
 from langchain.prompts import PromptTemplate
@@ -13,19 +15,27 @@ from ..config import Settings
 
 logger = logging.getLogger(__name__)
 
+# Approximate tokenizer for budgeting prompt context (Gemini's own tokenizer is remote)
+CONTEXT_ENCODING_NAME = "cl100k_base"
+
+
+@lru_cache(maxsize=1)
+def get_context_encoding() -> tiktoken.Encoding:
+    """Load the context tokenizer on first use rather than at import"""
+    return tiktoken.get_encoding(CONTEXT_ENCODING_NAME)
+
 
 class LLMService:
     """Service for LLM operations using Google Gemini"""
 
     def __init__(self, settings: Settings):
         self.settings = settings
-        self.llm = ChatGoogleGenerativeAI(
-            model=settings.google_model,
-            google_api_key=settings.google_api_key,
-            temperature=settings.llm_temperature,
-            max_output_tokens=settings.llm_max_tokens,
-            timeout=settings.llm_timeout
-        )
+        self.llm = self._create_llm(settings.llm_temperature)
+
+        # LLM clients keyed by temperature, reused across requests
+        self._llm_cache: Dict[float, ChatGoogleGenerativeAI] = {
+            round(settings.llm_temperature, 2): self.llm
+        }
 
         # System prompt for the AI agent
         self.system_prompt = PromptTemplate.from_template("""
@@ -50,6 +60,42 @@ User Question: {question}
 Your response:
 """)
 
+    def _create_llm(self, temperature: float) -> ChatGoogleGenerativeAI:
+        """Create a Gemini chat client with the given temperature"""
+        return ChatGoogleGenerativeAI(
+            model=self.settings.google_model,
+            google_api_key=self.settings.google_api_key,
+            temperature=temperature,
+            max_output_tokens=self.settings.llm_max_tokens,
+            timeout=self.settings.llm_timeout
+        )
+
+    def _get_llm(self, temperature: Optional[float] = None) -> ChatGoogleGenerativeAI:
+        """Get a cached LLM client for the given temperature (default client if None)"""
+        if temperature is None:
+            return self.llm
+
+        key = round(temperature, 2)
+        llm = self._llm_cache.get(key)
+        if llm is None:
+            llm = self._llm_cache[key] = self._create_llm(key)
+        return llm
+
+    def _fit_context(self, context: List[Document]) -> List[str]:
+        """Format context documents in ranked order until the context token budget is used"""
+        budget = self.settings.llm_max_context_tokens
+        encoding = get_context_encoding()
+        parts = []
+        for idx, doc in enumerate(context):
+            part = f"Document: {doc.metadata.get('filename', 'Unknown')}\n{doc.page_content}"
+            tokens = len(encoding.encode_ordinary(part))
+            if tokens > budget:
+                logger.info(f"Context token budget reached, skipping {len(context) - idx} documents")
+                break
+            budget -= tokens
+            parts.append(part)
+        return parts
+
     async def generate_response(
         self,
         query: str,
@@ -70,21 +116,14 @@ Your response:
             Dict with response and metadata
         """
         try:
-            # Format context
-            context_str = ""
-            if context:
-                context_str = "\n\n".join([
-                    f"Document: {doc.metadata.get('filename', 'Unknown')}\n{doc.page_content}"
-                    for doc in context
-                ])
+            # Format context, keeping only as many documents as fit the token budget
+            context_str = "\n\n".join(self._fit_context(context or []))
 
             # Format chat history
-            chat_history_str = ""
-            if conversation_history:
-                for msg in conversation_history[-5:]:  # Last 5 messages
-                    role = msg.get('role', 'user')
-                    content = msg.get('content', '')
-                    chat_history_str += f"{role.upper()}: {content}\n"
+            chat_history_str = "".join([
+                f"{msg.get('role', 'user').upper()}: {msg.get('content', '')}\n"
+                for msg in (conversation_history or [])[-5:]  # Last 5 messages
+            ])
 
             # Create prompt
             prompt = self.system_prompt.format(
@@ -93,16 +132,8 @@ Your response:
                 question=query
             )
 
-            # Create temporary LLM with custom temperature if provided
-            llm = self.llm
-            if temperature is not None:
-                llm = ChatGoogleGenerativeAI(
-                    model=self.settings.google_model,
-                    google_api_key=self.settings.google_api_key,
-                    temperature=temperature,
-                    max_output_tokens=self.settings.llm_max_tokens,
-                    timeout=self.settings.llm_timeout
-                )
+            # Use the LLM client for the requested temperature
+            llm = self._get_llm(temperature)
 
             # Generate response
             response = await llm.ainvoke([HumanMessage(content=prompt)])
@@ -2,34 +2,43 @@
 Memory Service for short-term and long-term conversation memory using Redis
 """
 import logging
-import json
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import time
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timezone
+from itertools import chain
 
+import orjson
 import redis.asyncio as redis
 
 from ..config import Settings
+from .redis_pool import get_memory_redis_pool
 
 logger = logging.getLogger(__name__)
 
+# Sorted set of session IDs scored by short-term memory expiry time
+ACTIVE_SESSIONS_KEY = "sessions:active"
+
+# Short-term memory streams. The prefix differs from the list-typed stm:{id}
+# keys of earlier releases, so a legacy list can never make XADD fail with
+# WRONGTYPE; those lists simply expire.
+SHORT_TERM_PREFIX = "stms:"
+LEGACY_SHORT_TERM_PREFIX = "stm:"
+
 
 class MemoryService:
     """Service for managing conversation memory in Redis"""
 
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, pool: Optional[redis.ConnectionPool] = None):
         self.settings = settings
+        self.pool = pool
         self.redis_client: Optional[redis.Redis] = None
 
     async def initialize(self):
         """Initialize Redis connection for memory"""
         try:
-            self.redis_client = redis.Redis(
-                host=self.settings.redis_memory_host,
-                port=self.settings.redis_memory_port,
-                password=self.settings.redis_password,
-                db=self.settings.redis_memory_db,
-                decode_responses=True
-            )
+            # Use the provided pool, else the process-wide pool for the memory database
+            pool = self.pool or get_memory_redis_pool(self.settings)
+            self.redis_client = redis.Redis(connection_pool=pool)
 
             await self.redis_client.ping()
             logger.info("Connected to Redis memory service successfully")
@@ -53,27 +62,28 @@ class MemoryService:
             ai_message: AI's response
         """
         try:
-            key = f"stm:{session_id}"
-
-            # Create message pair
-            message_pair = {
-                'timestamp': datetime.utcnow().isoformat(),
-                'user': user_message,
-                'ai': ai_message
-            }
-
-            # Add to list (FIFO)
-            await self.redis_client.lpush(key, json.dumps(message_pair))
-
-            # Trim to max size
-            await self.redis_client.ltrim(
-                key,
-                0,
-                self.settings.max_short_term_messages - 1
-            )
-
-            # Set TTL
-            await self.redis_client.expire(key, self.settings.short_term_memory_ttl)
+            key = f"{SHORT_TERM_PREFIX}{session_id}"
+
+            # Append and set TTL in a single round-trip
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                # Append to the session stream; MAXLEN trims in the same command.
+                # Exact trimming keeps the stream at the window size, so reads need no capping.
+                # The stream entry ID records the write time, so no timestamp field is stored.
+                pipe.xadd(
+                    key,
+                    {
+                        'user': user_message,
+                        'ai': ai_message
+                    },
+                    maxlen=self.settings.max_short_term_messages,
+                    approximate=False
+                )
+                pipe.expire(key, self.settings.short_term_memory_ttl)
+                pipe.zadd(
+                    ACTIVE_SESSIONS_KEY,
+                    {session_id: time.time() + self.settings.short_term_memory_ttl}
+                )
+                await pipe.execute()
 
             logger.debug(f"Added message to short-term memory for session {session_id}")
 
@@ -91,29 +101,28 @@ class MemoryService:
             List of conversation messages
         """
         try:
-            key = f"stm:{session_id}"
-            messages = await self.redis_client.lrange(key, 0, -1)
-
-            result = []
-            for msg in reversed(messages):  # Reverse to get chronological order
-                data = json.loads(msg)
-                result.append({
-                    'role': 'user',
-                    'content': data['user'],
-                    'timestamp': data['timestamp']
-                })
-                result.append({
-                    'role': 'assistant',
-                    'content': data['ai'],
-                    'timestamp': data['timestamp']
-                })
-
-            return result
+            key = f"{SHORT_TERM_PREFIX}{session_id}"
+            # XRANGE returns entries oldest-first, already in chronological order
+            messages = await self.redis_client.xrange(key)
+
+            return list(chain.from_iterable(
+                self._entry_messages(entry_id, data) for entry_id, data in messages
+            ))
 
         except Exception as e:
             logger.error(f"Error retrieving short-term memory: {e}")
             return []
 
+    @staticmethod
+    def _entry_messages(entry_id: bytes, data: Dict[bytes, bytes]) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Expand a raw short-term memory stream entry into user and assistant messages"""
+        # Stream IDs are "<unix ms>-<seq>"
+        timestamp = datetime.fromtimestamp(int(entry_id.split(b'-', 1)[0]) / 1000, tz=timezone.utc).isoformat()
+        return (
+            {'role': 'user', 'content': data[b'user'].decode(), 'timestamp': timestamp},
+            {'role': 'assistant', 'content': data[b'ai'].decode(), 'timestamp': timestamp}
+        )
+
     async def add_to_long_term_memory(
         self,
         session_id: str,
@@ -132,13 +141,17 @@ class MemoryService:
             key = f"ltm:{session_id}"
 
             memory_entry = {
-                'timestamp': datetime.utcnow().isoformat(),
+                'ts': time.time_ns(),  # formatted as 'timestamp' on read
                 'summary': summary,
                 'metadata': metadata or {}
             }
 
-            await self.redis_client.lpush(key, json.dumps(memory_entry))
-            await self.redis_client.expire(key, self.settings.long_term_memory_ttl)
+            # Append at the tail so the list reads back in chronological order,
+            # and set TTL in the same round-trip
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.rpush(key, orjson.dumps(memory_entry))
+                pipe.expire(key, self.settings.long_term_memory_ttl)
+                await pipe.execute()
 
             logger.debug(f"Added to long-term memory for session {session_id}")
 
@@ -159,19 +172,31 @@ class MemoryService:
             key = f"ltm:{session_id}"
             entries = await self.redis_client.lrange(key, 0, -1)
 
-            return [json.loads(entry) for entry in reversed(entries)]
+            return [self._decode_long_term_entry(entry) for entry in entries]
 
         except Exception as e:
             logger.error(f"Error retrieving long-term memory: {e}")
             return []
 
+    @staticmethod
+    def _decode_long_term_entry(raw: bytes) -> Dict[str, Any]:
+        """Decode a long-term memory entry, formatting its write time as ISO 8601"""
+        entry = orjson.loads(raw)
+        if 'ts' in entry:
+            entry['timestamp'] = datetime.fromtimestamp(entry.pop('ts') / 1e9, tz=timezone.utc).isoformat()
+        return entry
+
     async def clear_session(self, session_id: str):
         """Clear all memory for a session"""
         try:
-            await self.redis_client.delete(
-                f"stm:{session_id}",
-                f"ltm:{session_id}"
-            )
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.delete(
+                    f"{SHORT_TERM_PREFIX}{session_id}",
+                    f"{LEGACY_SHORT_TERM_PREFIX}{session_id}",
+                    f"ltm:{session_id}"
+                )
+                pipe.zrem(ACTIVE_SESSIONS_KEY, session_id)
+                await pipe.execute()
             logger.info(f"Cleared memory for session {session_id}")
 
         except Exception as e:
@@ -180,14 +205,14 @@ class MemoryService:
     async def get_active_sessions(self) -> List[str]:
         """Get list of active session IDs"""
         try:
-            sessions = set()
-
-            # Scan for short-term memory keys
-            async for key in self.redis_client.scan_iter(match="stm:*"):
-                session_id = key.split(":", 1)[1]
-                sessions.add(session_id)
-
-            return list(sessions)
+            # Read the session index instead of scanning the keyspace,
+            # purging sessions whose short-term memory has expired
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.zremrangebyscore(ACTIVE_SESSIONS_KEY, '-inf', time.time())
+                pipe.zrange(ACTIVE_SESSIONS_KEY, 0, -1)
+                _, sessions = await pipe.execute()
+
+            return [session_id.decode() for session_id in sessions]
 
         except Exception as e:
             logger.error(f"Error getting active sessions: {e}")
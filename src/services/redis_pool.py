@@ -0,0 +1,72 @@
+"""
+Shared Redis connection pools
+One pool per Redis server and database per process, reused by every service and lifespan
+"""
+import logging
+from functools import lru_cache
+from typing import Optional
+
+import redis.asyncio as redis
+
+from ..config import Settings
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache
+def get_redis_pool(
+    host: str,
+    port: int,
+    db: int,
+    password: Optional[str],
+    max_connections: int
+) -> redis.ConnectionPool:
+    """
+    Get the process-wide connection pool for a Redis database
+
+    Connection fields are passed separately rather than as a URL, so
+    passwords containing URL metacharacters (@ : / # %) work unescaped.
+
+    Args:
+        host: Redis host
+        port: Redis port
+        db: Database number
+        password: Redis password, if any
+        max_connections: Upper bound on pooled connections
+
+    Returns:
+        Shared connection pool returning raw bytes
+    """
+    logger.info(f"Creating Redis connection pool for {host}:{port}/{db} (max {max_connections} connections)")
+    return redis.ConnectionPool(
+        host=host,
+        port=port,
+        db=db,
+        password=password,
+        max_connections=max_connections,
+        decode_responses=False,
+        retry_on_timeout=True,
+        socket_keepalive=True
+    )
+
+
+def get_vector_redis_pool(settings: Settings) -> redis.ConnectionPool:
+    """Get the shared pool for the vector database"""
+    return get_redis_pool(
+        settings.redis_host,
+        settings.redis_port,
+        settings.redis_db,
+        settings.redis_password,
+        settings.redis_max_connections
+    )
+
+
+def get_memory_redis_pool(settings: Settings) -> redis.ConnectionPool:
+    """Get the shared pool for the memory database"""
+    return get_redis_pool(
+        settings.redis_memory_host,
+        settings.redis_memory_port,
+        settings.redis_memory_db,
+        settings.redis_password,
+        settings.redis_max_connections
+    )
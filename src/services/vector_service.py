@@ -1,44 +1,164 @@
 """
 Vector Database Service using Redis with RediSearch
 """
+import asyncio
+import contextlib
 import logging
-import json
+import hashlib
+import re
+import uuid
+from functools import lru_cache
 import httpx
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
+import numpy as np
+import orjson
+import zstandard as zstd
+from cachetools import LRUCache, TTLCache
 import redis.asyncio as redis
-from redis.commands.search.field import TextField, VectorField, NumericField
+from redis.commands.search import reducers
+from redis.commands.search.aggregation import AggregateRequest
+from redis.commands.search.field import TagField, VectorField, NumericField
 from redis.commands.search.indexDefinition import IndexDefinition, IndexType
 from redis.commands.search.query import Query
 from langchain.schema import Document
 
 from ..config import Settings
+from .redis_pool import get_vector_redis_pool
 
 logger = logging.getLogger(__name__)
 
+# Chunk text is stored zstd-compressed; frames embed their content size
+CONTENT_COMPRESSOR = zstd.ZstdCompressor(level=3)
+CONTENT_DECOMPRESSOR = zstd.ZstdDecompressor()
+
+# Characters that must be backslash-escaped inside a RediSearch tag query
+TAG_ESCAPE = re.compile(r"([^\w])")
+
+# RediSearch vector types and packed byte layouts for supported embedding storage dtypes
+VECTOR_TYPES = {
+    "float32": ("FLOAT32", np.float32),
+    "float16": ("FLOAT16", np.float16),
+    "int8": ("INT8", np.int8),
+}
+
+# Concurrent per-text embedding calls when the service has no batch endpoint
+EMBED_CONCURRENCY = 8
+
+# Ingest sizes: chunks embedded per request, and chunks coalesced into one
+# Redis pipeline by the background writer (flushed when full or after the
+# interval, in seconds)
+EMBED_BATCH = 64
+PIPELINE_BATCH = 256
+WRITE_FLUSH_INTERVAL = 0.005
+WRITE_QUEUE_SIZE = 16
+
+# Set of document IDs whose chunks were all written, per index schema
+# (see _schema_suffix); outside the doc: prefix
+COMPLETE_DOCUMENTS_PREFIX = "docs:complete:"
+
+# Bump when the index schema defined in code changes; together with the
+# schema-affecting settings it versions the index names (see _schema_suffix)
+INDEX_SCHEMA_VERSION = 2
+
+# Upper bound on rows returned by index-backed listings and deletes
+MAX_INDEX_RESULTS = 10000
+
+
+@lru_cache(maxsize=256)
+def _similarity_query(k: int, ranged: bool, filter_expr: Optional[str]) -> Query:
+    """Build (once per shape) the chunk search query; vector and radius/ef are params"""
+    if ranged:
+        # Range query: Redis returns only chunks within the distance radius
+        base_query = "(@embedding:[VECTOR_RANGE $radius $vec]=>{$YIELD_DISTANCE_AS: score})"
+        if filter_expr:
+            base_query = f"{base_query} {filter_expr}"
+    else:
+        # KNN query, pre-filtering candidates when a filter is given
+        base_query = f"({filter_expr or '*'})=>[KNN {k} @embedding $vec EF_RUNTIME $ef AS score]"
+
+    return (
+        Query(base_query)
+        .return_field("content_z", decode_field=False)
+        .return_fields("filename", "document_id", "score")
+        .sort_by("score")
+        .no_stopwords()
+        .paging(0, k)  # default page size of 10 would cut off larger k
+        .dialect(2)
+    )
+
+
+@lru_cache(maxsize=256)
+def _semantic_cache_query(variant: str) -> Query:
+    """Build (once per variant) the nearest-cached-query lookup"""
+    return (
+        Query(f"(@variant:{{{variant}}})=>[KNN 1 @embedding $vec AS score]")
+        .return_field("$.results", as_field="results")
+        .return_field("score")
+        .dialect(2)
+    )
+
 
 class VectorService:
     """Service for vector storage and retrieval using Redis"""
 
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, pool: Optional[redis.ConnectionPool] = None):
         self.settings = settings
+        self.pool = pool
         self.redis_client: Optional[redis.Redis] = None
-        self.index_name = settings.redis_vector_index
+        self.ft = None
+        self.query_cache_ft = None
+
+        # Pending hash writes shared by all add_documents calls, drained by _flush_writes
+        self._write_queue: asyncio.Queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._flusher: Optional[asyncio.Task] = None
+
         self.embedding_dimension = settings.embedding_dimension
-        self.http_client = httpx.AsyncClient(timeout=30.0)
+        self.embedding_dtype = settings.embedding_dtype.lower()
+        if self.embedding_dtype not in VECTOR_TYPES:
+            raise ValueError(f"Unsupported embedding dtype: {settings.embedding_dtype}")
+
+        # Index names carry a schema suffix, so a schema change builds a new index
+        suffix = self._schema_suffix()
+        self.index_name = f"{settings.redis_vector_index}_{suffix}"
+        self.query_cache_index = f"{settings.redis_vector_index}_qcache_{suffix}"
+        self.complete_documents_key = f"{COMPLETE_DOCUMENTS_PREFIX}{suffix}"
+        self.query_cache_prefix = f"qcache:{settings.redis_vector_index}:"
+        # Bumped whenever documents change; part of every search cache key and
+        # semantic cache tag so entries written before the change (in any
+        # worker) stop matching
+        self.query_cache_generation_key = f"qcache_generation:{settings.redis_vector_index}"
+        # One long-lived client per service so embedding calls reuse pooled
+        # keep-alive connections; HTTP/2 multiplexes when the service uses TLS
+        self.http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=64,
+                max_keepalive_connections=32,
+                keepalive_expiry=60
+            )
+        )
+        self._batch_supported = True
+
+        # Embeddings by content hash; backed by Redis emb:{model}:{hash} keys
+        self._embedding_cache: LRUCache = LRUCache(maxsize=settings.embedding_cache_size)
+
+        # Short-lived cache of search results for repeated queries, keyed by
+        # the shared generation below
+        self._search_cache: TTLCache = TTLCache(
+            maxsize=settings.search_cache_size,
+            ttl=settings.search_cache_ttl
+        )
 
     async def initialize(self):
         """Initialize Redis connection and create vector index"""
         try:
-            # Connect to Redis
-            self.redis_client = redis.Redis(
-                host=self.settings.redis_host,
-                port=self.settings.redis_port,
-                password=self.settings.redis_password,
-                db=self.settings.redis_db,
-                decode_responses=False,
-                encoding='utf-8'
-            )
+            # Connect to Redis through the provided pool, else the process-wide pool
+            pool = self.pool or get_vector_redis_pool(self.settings)
+            self.redis_client = redis.Redis(connection_pool=pool)
+            self.ft = self.redis_client.ft(self.index_name)
+            self.query_cache_ft = self.redis_client.ft(self.query_cache_index)
 
             # Test connection
             await self.redis_client.ping()
@@ -46,28 +166,159 @@ class VectorService:
 
             # Create vector index if it doesn't exist
             await self._create_index()
+            self._flusher = asyncio.create_task(self._flush_writes())
+            if self.settings.semantic_cache_enabled:
+                await self._create_query_cache_index()
 
         except Exception as e:
             logger.error(f"Failed to initialize Redis vector service: {e}")
             raise
 
+    def _schema_suffix(self) -> str:
+        """Short digest of everything that shapes the index schemas"""
+        schema_key = ":".join(str(part) for part in (
+            INDEX_SCHEMA_VERSION,
+            self.embedding_dtype,
+            self.embedding_dimension,
+            self.settings.vector_hnsw_m,
+            self.settings.vector_hnsw_ef_construction,
+        ))
+        return hashlib.blake2b(schema_key.encode(), digest_size=4).hexdigest()
+
+    @staticmethod
+    def _info_value(value: Any) -> Any:
+        """Decode a raw FT.INFO reply element"""
+        return value.decode() if isinstance(value, bytes) else value
+
+    def _reusable_chunks(self, info: Dict[str, Any]) -> bool:
+        """
+        Whether chunks indexed by an outdated index fit the current schema
+
+        Hash chunks with the same vector type and dimension are picked up by
+        the new index as-is. JSON chunks (the original schema) and vectors of
+        another size can't be, so they are deleted with their index.
+        """
+        definition = [self._info_value(v) for v in info.get('index_definition', [])]
+        key_type = dict(zip(definition[::2], definition[1::2])).get('key_type')
+        if key_type != 'HASH':
+            return False
+
+        for attribute in info.get('attributes', []):
+            fields = [self._info_value(v) for v in attribute]
+            fields = {str(k).lower(): v for k, v in zip(fields[::2], fields[1::2])}
+            if fields.get('type') == 'VECTOR':
+                if 'data_type' not in fields or 'dim' not in fields:
+                    return True  # older servers don't report these; keep the data
+                return (
+                    str(fields['data_type']).upper() == VECTOR_TYPES[self.embedding_dtype][0]
+                    and int(fields['dim']) == self.embedding_dimension
+                )
+        return True
+
+    async def _drop_stale_indexes(self):
+        """
+        Drop indexes left by earlier schemas of this service
+
+        They cover the same key prefixes, so keeping them would index every
+        chunk twice. Chunks the current schema can still index are kept;
+        the rest are deleted along with their index, since nothing could
+        list, search or delete them afterwards.
+        """
+        base = re.escape(self.settings.redis_vector_index)
+        pattern = re.compile(rf"^{base}(_qcache)?(_[0-9a-f]{{8}})?$")
+        current = {self.index_name, self.query_cache_index}
+
+        for name in await self.redis_client.execute_command("FT._LIST"):
+            name = self._info_value(name)
+            if name in current or not pattern.match(name):
+                continue
+            try:
+                index = self.redis_client.ft(name)
+                keep = self._reusable_chunks(await index.info())
+                if keep:
+                    logger.warning(
+                        f"Dropping index '{name}' built with an outdated schema (now '{self.index_name}'); "
+                        f"its chunks are re-indexed, but documents must be re-uploaded to be marked complete"
+                    )
+                else:
+                    logger.warning(
+                        f"Dropping index '{name}' built with an outdated schema (now '{self.index_name}') "
+                        f"and deleting its incompatible chunks; documents must be re-ingested"
+                    )
+                await index.dropindex(delete_documents=not keep)
+
+                # Completion markers belong to the dropped index's schema
+                match = pattern.match(name)
+                if match.group(2):
+                    await self.redis_client.unlink(f"{COMPLETE_DOCUMENTS_PREFIX}{match.group(2)[1:]}")
+            except Exception as e:
+                logger.warning(f"Could not drop index '{name}' (another worker may have): {e}")
+
     async def _create_index(self):
         """Create vector search index in Redis"""
+        try:
+            await self._drop_stale_indexes()
+        except Exception as e:
+            logger.error(f"Error checking for outdated vector indexes: {e}")
+
         try:
             # Check if index exists
             try:
-                await self.redis_client.ft(self.index_name).info()
+                await self.ft.info()
                 logger.info(f"Vector index '{self.index_name}' already exists")
                 return
             except:
                 pass  # Index doesn't exist, create it
 
-            # Define schema
+            # Define schema over hash fields; embeddings are packed vector bytes
+            schema = (
+                TagField("filename", separator="|"),  # filenames may contain commas
+                TagField("document_id"),
+                NumericField("chunk_index"),
+                VectorField(
+                    "embedding",
+                    "HNSW",
+                    {
+                        "TYPE": VECTOR_TYPES[self.embedding_dtype][0],
+                        "DIM": self.embedding_dimension,
+                        "DISTANCE_METRIC": "COSINE",
+                        "M": self.settings.vector_hnsw_m,
+                        "EF_CONSTRUCTION": self.settings.vector_hnsw_ef_construction,
+                    }
+                ),
+            )
+
+            # Create index
+            await self.ft.create_index(
+                fields=schema,
+                definition=IndexDefinition(
+                    prefix=[f"doc:"],
+                    index_type=IndexType.HASH
+                )
+            )
+
+            logger.info(f"Created vector index '{self.index_name}'")
+
+        except Exception as e:
+            # Another worker may have created it concurrently; anything else is fatal,
+            # since searches against a missing index silently return nothing
+            try:
+                await self.ft.info()
+            except Exception:
+                logger.error(f"Error creating vector index '{self.index_name}': {e}")
+                raise e
+
+    async def _create_query_cache_index(self):
+        """Create the small vector index backing the semantic query cache"""
+        try:
+            try:
+                await self.query_cache_ft.info()
+                return
+            except:
+                pass  # Index doesn't exist, create it
+
             schema = (
-                TextField("$.content", as_name="content"),
-                TextField("$.filename", as_name="filename"),
-                TextField("$.document_id", as_name="document_id"),
-                NumericField("$.chunk_index", as_name="chunk_index"),
+                TagField("$.variant", as_name="variant"),
                 VectorField(
                     "$.embedding",
                     "FLAT",
@@ -80,20 +331,121 @@ class VectorService:
                 ),
             )
 
-            # Create index
-            await self.redis_client.ft(self.index_name).create_index(
+            await self.query_cache_ft.create_index(
                 fields=schema,
                 definition=IndexDefinition(
-                    prefix=[f"doc:"],
+                    prefix=[self.query_cache_prefix],
                     index_type=IndexType.JSON
                 )
             )
 
-            logger.info(f"Created vector index '{self.index_name}'")
+            logger.info(f"Created query cache index '{self.query_cache_index}'")
 
         except Exception as e:
-            logger.error(f"Error creating vector index: {e}")
-            # Don't raise, index might already exist
+            logger.error(f"Error creating query cache index: {e}")
+
+    @staticmethod
+    def _query_variant(
+        k: int,
+        score_threshold: Optional[float],
+        filter_expr: Optional[str],
+        generation: int
+    ) -> str:
+        """Tag value separating cached results by search parameters and document-set generation"""
+        key = f"{k}:{score_threshold}:{filter_expr}:{generation}"
+        return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+    async def _query_cache_generation(self) -> Optional[int]:
+        """Current semantic cache generation, or None if it can't be read"""
+        try:
+            return int(await self.redis_client.get(self.query_cache_generation_key) or 0)
+        except Exception as e:
+            logger.warning(f"Semantic cache generation lookup failed: {e}")
+            return None
+
+    @staticmethod
+    def tag_filter(field: str, value: str) -> str:
+        """Build an exact-match RediSearch filter on a tag field"""
+        escaped = TAG_ESCAPE.sub(r"\\\1", value)
+        return f"@{field}:{{{escaped}}}"
+
+    async def _get_semantic_cache(
+        self,
+        embedding: np.ndarray,
+        variant: str
+    ) -> Optional[List[Document]]:
+        """Return cached results of a near-duplicate earlier query, if any"""
+        try:
+            params = {"vec": embedding.tobytes()}
+            results = await self.query_cache_ft.search(_semantic_cache_query(variant), query_params=params)
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {e}")
+            return None
+
+        for doc in results.docs:
+            if 1 - float(doc.score) >= self.settings.semantic_cache_threshold:
+                return [
+                    Document(page_content=item["page_content"], metadata=item["metadata"])
+                    for item in orjson.loads(doc.results)
+                ]
+        return None
+
+    async def _set_semantic_cache(
+        self,
+        embedding: np.ndarray,
+        variant: str,
+        documents: List[Document]
+    ):
+        """Store search results under the query embedding"""
+        key = f"{self.query_cache_prefix}{uuid.uuid4().hex}"
+        entry = {
+            "variant": variant,
+            "embedding": embedding.tolist(),
+            "results": [
+                {"page_content": doc.page_content, "metadata": doc.metadata}
+                for doc in documents
+            ]
+        }
+        try:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            pipeline.json().set(key, "$", entry)
+            pipeline.expire(key, self.settings.semantic_cache_ttl)
+            await pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Semantic cache write failed: {e}")
+
+    async def _clear_query_caches(self):
+        """Drop cached search results after the document set changes"""
+        # Invalidate first: entries cached under the previous generation, in
+        # every worker, stop matching even if the cleanup below fails
+        await self.redis_client.incr(self.query_cache_generation_key)
+        self._search_cache.clear()
+        if not self.settings.semantic_cache_enabled:
+            return
+
+        # Then remove entries through the cache index, a page at a time
+        try:
+            q = Query("*").no_content().paging(0, PIPELINE_BATCH)
+            while True:
+                results = await self.query_cache_ft.search(q)
+                keys = [doc.id for doc in results.docs]
+                if not keys:
+                    break
+                await self.redis_client.unlink(*keys)
+        except Exception as e:
+            logger.warning(f"Semantic cache cleanup failed, entries expire by TTL: {e}")
+
+    def _encode_vector(self, embedding: np.ndarray) -> bytes:
+        """
+        Pack an embedding into the little-endian bytes stored in the index
+
+        For int8 storage each vector is scaled so its largest component maps
+        to 127. No scale is stored: cosine distance ignores vector magnitude.
+        """
+        if self.embedding_dtype == "int8":
+            peak = float(np.abs(embedding).max(initial=0.0)) or 1.0
+            embedding = np.rint(embedding * (127.0 / peak))
+        return embedding.astype(VECTOR_TYPES[self.embedding_dtype][1], copy=False).tobytes()
 
     async def _get_embedding(self, text: str) -> List[float]:
         """Get embedding from embedding service"""
@@ -110,6 +462,156 @@ class VectorService:
             logger.error(f"Error getting embedding: {e}")
             raise
 
+    async def _get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Get embeddings for multiple texts in a single embedding service call
+
+        Falls back to bounded concurrent per-text calls if the service does
+        not expose /embed_batch.
+        """
+        if not self._batch_supported:
+            return await self._get_embeddings_concurrent(texts)
+
+        try:
+            response = await self.http_client.post(
+                f"{self.settings.embedding_service_url}/embed_batch",
+                json={"texts": texts}
+            )
+            if response.status_code in (404, 405):
+                logger.warning("Embedding service has no /embed_batch, using per-text calls")
+                self._batch_supported = False
+                return await self._get_embeddings_concurrent(texts)
+            response.raise_for_status()
+            data = response.json()
+            return data['embeddings']
+
+        except Exception as e:
+            logger.error(f"Error getting batch embeddings: {e}")
+            raise
+
+    async def _get_embeddings_concurrent(self, texts: List[str]) -> List[List[float]]:
+        """Get embeddings with concurrent single-text calls, at most EMBED_CONCURRENCY in flight"""
+        semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+        async def embed(text: str) -> List[float]:
+            async with semaphore:
+                return await self._get_embedding(text)
+
+        return await asyncio.gather(*(embed(text) for text in texts))
+
+    def _embedding_key(self, text: str) -> str:
+        """Content-addressed cache key for a text under the configured model"""
+        digest = hashlib.sha256(f"{self.settings.embedding_model}:{text}".encode()).hexdigest()
+        return f"emb:{self.settings.embedding_model}:{digest}"
+
+    async def _embed_texts(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Get float32 embeddings through the in-process and Redis caches
+
+        Cache misses are checked against Redis with one MGET and the rest are
+        embedded in a single service call, then written back to both tiers.
+        Vectors stay numpy arrays so they pack to bytes without a Python copy.
+        """
+        keys = [self._embedding_key(text) for text in texts]
+        embeddings: List[Optional[np.ndarray]] = [self._embedding_cache.get(key) for key in keys]
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            try:
+                cached = await self.redis_client.mget([keys[i] for i in missing])
+            except Exception as e:
+                logger.warning(f"Embedding cache lookup failed: {e}")
+                cached = [None] * len(missing)
+
+            for i, raw in zip(missing, cached):
+                if raw is not None:
+                    embeddings[i] = np.frombuffer(raw, dtype=np.float32)
+                    self._embedding_cache[keys[i]] = embeddings[i]
+            missing = [i for i in missing if embeddings[i] is None]
+
+        if missing:
+            if len(missing) == 1:
+                fresh = [await self._get_embedding(texts[missing[0]])]
+            else:
+                fresh = await self._get_embeddings_batch([texts[i] for i in missing])
+
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for i, values in zip(missing, fresh):
+                embedding = np.asarray(values, dtype=np.float32)
+                embeddings[i] = embedding
+                self._embedding_cache[keys[i]] = embedding
+                pipeline.set(keys[i], embedding.tobytes(), ex=self.settings.embedding_cache_ttl)
+            try:
+                await pipeline.execute()
+            except Exception as e:
+                logger.warning(f"Embedding cache write failed: {e}")
+
+        return embeddings
+
+    async def _submit_writes(self, writes: List[Tuple[str, Dict[str, Any]]]) -> asyncio.Future:
+        """Queue hash writes for the background writer; the future resolves once flushed"""
+        if self._flusher is None or self._flusher.done():
+            raise RuntimeError("Vector store writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((writes, future))
+        if self._flusher.done() and not future.done():
+            # The writer stopped while this call waited for queue space
+            future.set_exception(RuntimeError("Vector store writer stopped"))
+        return future
+
+    def _drain_write_queue(self, batch: List, limit: Optional[int] = None) -> int:
+        """Move queued writes into batch without waiting; returns chunks moved"""
+        moved = 0
+        while (limit is None or moved < limit) and not self._write_queue.empty():
+            item = self._write_queue.get_nowait()
+            batch.append(item)
+            moved += len(item[0])
+        return moved
+
+    async def _flush_writes(self):
+        """Coalesce queued writes from all callers into shared pipelines"""
+        batch = []
+        try:
+            while True:
+                batch = [await self._write_queue.get()]
+                pending = len(batch[0][0])
+                pending += self._drain_write_queue(batch, PIPELINE_BATCH - pending)
+                if pending < PIPELINE_BATCH:
+                    # Give concurrent ingests a moment to add to this flush
+                    await asyncio.sleep(WRITE_FLUSH_INTERVAL)
+                    self._drain_write_queue(batch, PIPELINE_BATCH - pending)
+
+                pipeline = self.redis_client.pipeline(transaction=False)
+                for writes, _ in batch:
+                    for key, mapping in writes:
+                        pipeline.hset(key, mapping=mapping)
+
+                try:
+                    results = await pipeline.execute(raise_on_error=False)
+                except Exception as e:
+                    logger.error(f"Error flushing document writes: {e}")
+                    results = [e] * sum(len(writes) for writes, _ in batch)
+
+                # Fail only the callers whose own writes failed
+                offset = 0
+                for writes, future in batch:
+                    own = results[offset:offset + len(writes)]
+                    offset += len(writes)
+                    if future.done():
+                        continue
+                    error = next((r for r in own if isinstance(r, Exception)), None)
+                    if error is None:
+                        future.set_result(None)
+                    else:
+                        future.set_exception(error)
+                batch = []
+        finally:
+            # Never leave add_documents waiting on a writer that has stopped
+            self._drain_write_queue(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Vector store writer stopped"))
+
     async def add_documents(
         self,
         documents: List[Document],
@@ -125,41 +627,68 @@ class VectorService:
         Returns:
             Number of documents added
         """
+        flushed = []
         try:
-            pipeline = self.redis_client.pipeline()
-
-            for idx, doc in enumerate(documents):
-                # Get embedding
-                embedding = await self._get_embedding(doc.page_content)
-
-                # Prepare document data
-                doc_data = {
-                    "content": doc.page_content,
-                    "filename": doc.metadata.get('filename', ''),
-                    "document_id": document_id,
-                    "chunk_index": idx,
-                    "embedding": embedding,
-                    "metadata": json.dumps(doc.metadata)
-                }
+            # Embed mini-batches while the background writer flushes earlier ones
+            for start in range(0, len(documents), EMBED_BATCH):
+                batch = documents[start:start + EMBED_BATCH]
+                embeddings = await self._embed_texts([doc.page_content for doc in batch])
+
+                writes = []
+                for idx, (doc, embedding) in enumerate(zip(batch, embeddings), start):
+                    # Prepare hash fields
+                    mapping = {
+                        "content_z": CONTENT_COMPRESSOR.compress(doc.page_content.encode()),
+                        "filename": doc.metadata.get('filename', ''),
+                        "document_id": document_id,
+                        "chunk_index": idx,
+                        "embedding": self._encode_vector(embedding),
+                        "metadata": orjson.dumps(doc.metadata)
+                    }
+                    writes.append((f"doc:{document_id}:{idx}", mapping))
 
                 # Store in Redis
-                key = f"doc:{document_id}:{idx}"
-                pipeline.json().set(key, "$", doc_data)
+                flushed.append(await self._submit_writes(writes))
 
-            await pipeline.execute()
+            await asyncio.gather(*flushed)
+
+            # Mark the document complete only once every chunk is stored
+            await self.redis_client.sadd(self.complete_documents_key, document_id)
+            await self._clear_query_caches()
             logger.info(f"Added {len(documents)} document chunks to vector store")
 
             return len(documents)
 
         except Exception as e:
             logger.error(f"Error adding documents to vector store: {e}")
+            await self._discard_partial_ingest(document_id, len(documents), flushed)
             raise
 
+    async def _discard_partial_ingest(
+        self,
+        document_id: str,
+        chunk_count: int,
+        flushed: List[asyncio.Future]
+    ):
+        """Remove chunks of a failed ingest so the document can be uploaded again"""
+        # Let queued writes settle first so none land after the cleanup
+        await asyncio.gather(*flushed, return_exceptions=True)
+        try:
+            keys = [f"doc:{document_id}:{idx}" for idx in range(chunk_count)]
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for start in range(0, len(keys), PIPELINE_BATCH):
+                pipeline.unlink(*keys[start:start + PIPELINE_BATCH])
+            pipeline.srem(self.complete_documents_key, document_id)
+            await pipeline.execute()
+        except Exception as e:
+            logger.error(f"Error removing partial chunks of document {document_id}: {e}")
+
     async def similarity_search(
         self,
         query: str,
         k: int = 5,
-        score_threshold: Optional[float] = None
+        score_threshold: Optional[float] = None,
+        filter_expr: Optional[str] = None
     ) -> List[Document]:
         """
         Perform similarity search
@@ -168,39 +697,64 @@ class VectorService:
             query: Search query
             k: Number of results to return
             score_threshold: Minimum similarity score
+            filter_expr: RediSearch filter applied before the KNN search,
+                e.g. tag_filter("document_id", id)
 
         Returns:
             List of relevant documents
         """
         try:
+            # Serve repeated queries from cache. The shared generation is part of
+            # the key, so a document change in any worker invalidates every
+            # worker's entries; without it, nothing is cached.
+            generation = await self._query_cache_generation()
+            cache_key = None
+            if generation is not None:
+                normalized = query.strip().lower()
+                cache_key = (
+                    hashlib.blake2b(normalized.encode(), digest_size=16).digest(),
+                    k, score_threshold, filter_expr, generation
+                )
+                cached = self._search_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
             # Get query embedding
-            query_embedding = await self._get_embedding(query)
+            query_embedding = (await self._embed_texts([query]))[0]
+
+            # Reuse results of a near-duplicate query
+            variant = None
+            if self.settings.semantic_cache_enabled and generation is not None:
+                variant = self._query_variant(k, score_threshold, filter_expr, generation)
+                cached = await self._get_semantic_cache(query_embedding, variant)
+                if cached is not None:
+                    self._search_cache[cache_key] = cached
+                    return cached
 
             # Prepare KNN query
-            query_vector = [float(x) for x in query_embedding]
+            query_vector = self._encode_vector(query_embedding)
 
-            # Create query
-            base_query = f"*=>[KNN {k} @embedding $vec AS score]"
-            q = Query(base_query).return_fields("content", "filename", "document_id", "score").dialect(2)
+            if score_threshold:
+                params = {
+                    "vec": query_vector,
+                    "radius": 1 - score_threshold  # cosine distance = 1 - similarity
+                }
+            else:
+                params = {
+                    "vec": query_vector,
+                    "ef": self.settings.vector_hnsw_ef_runtime
+                }
 
             # Execute search
-            params = {
-                "vec": query_vector
-            }
-
-            results = await self.redis_client.ft(self.index_name).search(q, query_params=params)
+            q = _similarity_query(k, bool(score_threshold), filter_expr)
+            results = await self.ft.search(q, query_params=params)
 
             # Process results
             documents = []
             for doc in results.docs:
                 score = 1 - float(doc.score)  # Convert distance to similarity
-
-                # Apply score threshold
-                if score_threshold and score < score_threshold:
-                    continue
-
                 documents.append(Document(
-                    page_content=doc.content,
+                    page_content=CONTENT_DECOMPRESSOR.decompress(doc.content_z).decode(),
                     metadata={
                         'filename': doc.filename,
                         'document_id': doc.document_id,
@@ -209,24 +763,40 @@ class VectorService:
                 ))
 
             logger.info(f"Found {len(documents)} similar documents")
+            if cache_key is not None:
+                self._search_cache[cache_key] = documents
+            if variant is not None:
+                await self._set_semantic_cache(query_embedding, variant, documents)
             return documents
 
         except Exception as e:
             logger.error(f"Error performing similarity search: {e}")
             return []
 
+    async def document_exists(self, document_id: str) -> bool:
+        """Check whether a document has been stored completely"""
+        return bool(await self.redis_client.sismember(self.complete_documents_key, document_id))
+
     async def delete_document(self, document_id: str) -> bool:
         """Delete all chunks of a document"""
         try:
-            # Find all keys for this document
-            pattern = f"doc:{document_id}:*"
-            keys = []
-            async for key in self.redis_client.scan_iter(match=pattern):
-                keys.append(key)
-
-            if keys:
-                await self.redis_client.delete(*keys)
-                logger.info(f"Deleted {len(keys)} chunks for document {document_id}")
+            await self.redis_client.srem(self.complete_documents_key, document_id)
+
+            # Find this document's chunk keys through the index a page at a time;
+            # unlinked keys leave the index, so each page starts at offset 0
+            q = Query(self.tag_filter("document_id", document_id)).no_content().paging(0, MAX_INDEX_RESULTS)
+            deleted = 0
+            while True:
+                results = await self.ft.search(q)
+                keys = [doc.id for doc in results.docs]
+                if not keys:
+                    break
+                await self.redis_client.unlink(*keys)
+                deleted += len(keys)
+
+            if deleted:
+                await self._clear_query_caches()
+                logger.info(f"Deleted {deleted} chunks for document {document_id}")
 
             return True
 
@@ -237,22 +807,29 @@ class VectorService:
     async def list_documents(self) -> List[Dict[str, Any]]:
         """List all documents in vector store"""
         try:
-            documents = {}
-            pattern = "doc:*"
-
-            async for key in self.redis_client.scan_iter(match=pattern):
-                data = await self.redis_client.json().get(key)
-                doc_id = data.get('document_id')
-
-                if doc_id not in documents:
-                    documents[doc_id] = {
-                        'document_id': doc_id,
-                        'filename': data.get('filename'),
-                        'chunks': 0
-                    }
-                documents[doc_id]['chunks'] += 1
+            # Group chunks per document server-side in one round-trip
+            request = (
+                AggregateRequest("*")
+                .load("@document_id", "@filename")
+                .group_by(
+                    "@document_id",
+                    reducers.count().alias("chunks"),
+                    reducers.first_value("@filename").alias("filename")
+                )
+                .limit(0, MAX_INDEX_RESULTS)
+            )
+            result = await self.ft.aggregate(request)
 
-            return list(documents.values())
+            documents = []
+            for row in result.rows:
+                fields = dict(zip(row[::2], row[1::2]))
+                documents.append({
+                    'document_id': fields[b'document_id'].decode(),
+                    'filename': fields[b'filename'].decode() if fields.get(b'filename') else None,
+                    'chunks': int(fields[b'chunks'])
+                })
+
+            return documents
 
         except Exception as e:
             logger.error(f"Error listing documents: {e}")
@@ -268,6 +845,10 @@ class VectorService:
 
     async def close(self):
         """Close Redis connection"""
+        if self._flusher:
+            self._flusher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flusher
         if self.redis_client:
             await self.redis_client.close()
         await self.http_client.aclose()
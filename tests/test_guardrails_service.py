@@ -0,0 +1,34 @@
+"""
+Regression tests for the regex guardrail scan
+"""
+import pytest
+
+pytest.importorskip("cachetools")
+pytest.importorskip("nemoguardrails")
+
+from src.config import Settings
+from src.services.guardrails_service import GuardrailsService
+
+
+@pytest.fixture
+def service():
+    service = GuardrailsService(Settings(google_api_key="test"))
+    service.hs_database = None  # exercise the re engine
+    return service
+
+
+@pytest.mark.parametrize("text", [
+    "mysql.admin@corp.com",
+    "reach john.hacker@x.io today",
+    "NoSQL@db.com",
+])
+def test_blocked_keyword_inside_email_is_blocked(service, text):
+    blocked, pii_found = service._scan(text)
+    assert blocked is not None
+    assert pii_found == []
+
+
+def test_email_without_blocked_keyword_is_pii(service):
+    blocked, pii_found = service._scan("write to jane.doe@example.com")
+    assert blocked is None
+    assert pii_found == ['EMAIL']